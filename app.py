@@ -1,7 +1,15 @@
+# Patch the stdlib for cooperative sockets/threads before anything else imports it
+import eventlet
+eventlet.monkey_patch()
+
+import orjson
 import plivo
 from flask import Flask, request, jsonify, render_template, url_for
+from flask.json.provider import DefaultJSONProvider
 from flask_socketio import SocketIO, emit
 from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import func, inspect, select, text
 import os
 
 from config import Config
@@ -12,13 +20,41 @@ from services.call_manager import (
     get_call_session, end_call_session
 )
 
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (jsonify, request.json)"""
+    
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+# json module stand-in for Socket.IO packets (the Redis message queue
+# manager is not given this and encodes its own payloads)
+socketio_json = SimpleNamespace(
+    dumps=lambda obj, **kwargs: orjson.dumps(obj).decode(),
+    loads=lambda s, **kwargs: orjson.loads(s)
+)
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.config.from_object(Config)
 
 # Initialize extensions
 db.init_app(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(
+    app,
+    async_mode='eventlet',
+    cors_allowed_origins="*",
+    message_queue=app.config['REDIS_URL'],
+    json=socketio_json
+)
+agent_heap_manager.init_app(app, socketio)
 
 # Initialize Plivo client
 plivo_client = None
@@ -29,12 +65,140 @@ if app.config['PLIVO_AUTH_ID'] and app.config['PLIVO_AUTH_TOKEN']:
     )
 
 
-def get_base_url():
-    """Get base URL for callbacks (use ngrok URL in production)"""
-    # Replace with your actual ngrok URL when testing
-    # Example: return "https://abc123.ngrok.io"
-    ngrok_url = "https://scholarly-introspective-irene.ngrok-free.dev"
-    return ngrok_url
+# Base URL for callbacks (set NGROK_URL to your ngrok URL when testing)
+BASE_URL = app.config['BASE_URL']
+
+
+# ==================== IVR XML TEMPLATES ====================
+# Rendered once at import time; handlers return the finished bytes.
+# Non-ASCII prompts are encoded as UTF-8 to match the XML declaration.
+
+_XML_HEADERS = {'Content-Type': 'text/xml'}
+
+BASE_URL_BYTES = BASE_URL.encode()
+
+_IVR_START_TEMPLATE = b'''<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Speak>Welcome to our IVR system.</Speak>
+    <GetDigits action="%s/ivr/language" method="POST" numDigits="1" timeout="10" retries="2">
+        <Speak>Press 1 for English. Press 2 for Spanish.</Speak>
+    </GetDigits>
+    <Speak>We did not receive your input. Goodbye.</Speak>
+    <Hangup/>
+</Response>'''
+
+_INVALID_SELECTION_TEMPLATE = b'''<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Speak>Invalid selection.</Speak>
+    <Redirect>%s%s</Redirect>
+</Response>'''
+
+_REDIRECT_TEMPLATE = b'''<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Redirect>%s%s</Redirect>
+</Response>'''
+
+_SPEAK_HANGUP_TEMPLATE = b'''<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Speak>%s</Speak>
+    <Hangup/>
+</Response>'''
+
+_MENU_TEMPLATE = b'''<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <GetDigits action="%s/ivr/action" method="POST" numDigits="1" timeout="10" retries="2">
+        <Speak>%s</Speak>
+    </GetDigits>
+    <Speak>No input received. Goodbye.</Speak>
+    <Hangup/>
+</Response>'''
+
+_CONNECT_AGENT_TEMPLATE = b'''<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Speak>Connecting you to an agent. Please hold.</Speak>
+    <Wait length="2"/>
+    <Speak>%s</Speak>
+    <Redirect>%s/ivr/feedback</Redirect>
+</Response>'''
+
+_FEEDBACK_TEMPLATE = b'''<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <GetDigits action="%s/plivo/callback" method="POST" numDigits="1" timeout="10" retries="1">
+        <Speak>%s</Speak>
+    </GetDigits>
+    <Speak>Thank you. Goodbye.</Speak>
+    <Hangup/>
+</Response>'''
+
+# Language-specific prompts: {language: prompt_bytes}
+_MENU_PROMPTS = {
+    'english': "Press 1 to play a message. Press 2 to connect to a live agent.".encode(),
+    'spanish': "Presione 1 para reproducir un mensaje. Presione 2 para conectarse con un agente en vivo.".encode()
+}
+
+_DEMO_MESSAGES = {
+    'english': "Thank you for calling. This is a demo message. You will now be disconnected.".encode(),
+    'spanish': "Gracias por llamar. Este es un mensaje de demostración. Ahora se desconectará.".encode()
+}
+
+_NO_AGENT_MESSAGES = {
+    'english': "Sorry, all agents are currently busy. Please try again later.".encode(),
+    'spanish': "Lo sentimos, todos los agentes están ocupados. Por favor, inténtelo más tarde.".encode()
+}
+
+_AGENT_CONNECTED_MESSAGES = {
+    'english': "You have been connected to an agent. Thank you for calling.".encode(),
+    'spanish': "Ha sido conectado con un agente. Gracias por llamar.".encode()
+}
+
+_AGENT_FAILED_MESSAGES = {
+    'english': "The agent connection failed. Thank you for calling. Goodbye.".encode(),
+    'spanish': "La conexión del agente falló. Gracias por llamar. Adiós.".encode()
+}
+
+_FEEDBACK_PROMPTS = {
+    'english': "Please rate your experience. Press 1 for Poor, 2 for Fair, 3 for Good, or 4 for Excellent.".encode(),
+    'spanish': "Por favor califique su experiencia. Presione 1 para Pobre, 2 para Regular, 3 para Bueno o 4 para Excelente.".encode()
+}
+
+# Complete responses ({language: xml_bytes} where the prompt is localized)
+_IVR_START_XML = _IVR_START_TEMPLATE % BASE_URL_BYTES
+_REDIRECT_START_XML = _REDIRECT_TEMPLATE % (BASE_URL_BYTES, b'/ivr/start')
+_REDIRECT_MENU_XML = _REDIRECT_TEMPLATE % (BASE_URL_BYTES, b'/ivr/menu')
+_INVALID_START_XML = _INVALID_SELECTION_TEMPLATE % (BASE_URL_BYTES, b'/ivr/start')
+_INVALID_MENU_XML = _INVALID_SELECTION_TEMPLATE % (BASE_URL_BYTES, b'/ivr/menu')
+_SESSION_ERROR_XML = _SPEAK_HANGUP_TEMPLATE % b'Session error. Goodbye.'
+_GOODBYE_XML = _SPEAK_HANGUP_TEMPLATE % b'Thank you for your feedback. Goodbye.'
+
+_MENU_XML = {
+    language: _MENU_TEMPLATE % (BASE_URL_BYTES, prompt)
+    for language, prompt in _MENU_PROMPTS.items()
+}
+_DEMO_XML = {
+    language: _SPEAK_HANGUP_TEMPLATE % message
+    for language, message in _DEMO_MESSAGES.items()
+}
+_NO_AGENT_XML = {
+    language: _SPEAK_HANGUP_TEMPLATE % message
+    for language, message in _NO_AGENT_MESSAGES.items()
+}
+_AGENT_CONNECTED_XML = {
+    language: _CONNECT_AGENT_TEMPLATE % (message, BASE_URL_BYTES)
+    for language, message in _AGENT_CONNECTED_MESSAGES.items()
+}
+_AGENT_FAILED_XML = {
+    language: _SPEAK_HANGUP_TEMPLATE % message
+    for language, message in _AGENT_FAILED_MESSAGES.items()
+}
+_FEEDBACK_XML = {
+    language: _FEEDBACK_TEMPLATE % (BASE_URL_BYTES, prompt)
+    for language, prompt in _FEEDBACK_PROMPTS.items()
+}
+
+
+def _localized(messages, language):
+    """Pick the English variant for English calls, Spanish otherwise"""
+    return messages['english'] if language == 'english' else messages['spanish']
 
 
 # ==================== DATABASE INITIALIZATION ====================
@@ -44,8 +208,18 @@ def init_db():
     with app.app_context():
         db.create_all()
         
+        # Databases created before priority_score existed: create_all doesn't
+        # alter tables, so add the column here and backfill it below
+        if 'priority_score' not in {column['name'] for column in inspect(db.engine).get_columns('agents')}:
+            db.session.execute(text('ALTER TABLE agents ADD COLUMN priority_score FLOAT'))
+            db.session.execute(text('CREATE INDEX ix_agents_priority_score ON agents (priority_score)'))
+        
+        for agent in db.session.scalars(select(Agent).where(Agent.priority_score.is_(None))):
+            agent.refresh_priority_score()
+        db.session.commit()
+        
         # Check if agents already exist
-        if Agent.query.count() == 0:
+        if db.session.scalar(select(func.count()).select_from(Agent)) == 0:
             # Create English agent
             english_agent = Agent(
                 phone_number=app.config['ENGLISH_AGENT_NUMBER'],
@@ -92,13 +266,11 @@ def initiate_call():
         return jsonify({'error': 'Plivo credentials not configured'}), 500
     
     try:
-        base_url = get_base_url()
-        
         # Make call using Plivo
         response = plivo_client.calls.create(
             from_=app.config['PLIVO_FROM_NUMBER'],
             to_=to_number,
-            answer_url=f'{base_url}/ivr/start',
+            answer_url=f'{BASE_URL}/ivr/start',
             answer_method='GET'
         )
         
@@ -119,41 +291,26 @@ def ivr_start():
     from_number = request.values.get('From')
     
     # Check if call already exists (Plivo may retry this endpoint)
-    existing_call = CallLog.query.filter_by(call_uuid=call_uuid).first()
+    existing_call = db.session.scalar(select(CallLog.id).where(CallLog.call_uuid == call_uuid))
     if not existing_call:
         # Create call session
         create_call_session(call_uuid, from_number)
         
-        # Create or get customer
-        customer = Customer.query.get(from_number)
-        if not customer:
-            customer = Customer(phone_number=from_number)
-            db.session.add(customer)
-            db.session.commit()
-        
-        # Create call log
+        # Create call log and customer together in a single commit
         call_log = CallLog(
             call_uuid=call_uuid,
             customer_phone=from_number,
             status='in-progress'
         )
+        
+        # Create customer if new (the flush inserts it before the call log)
+        if not db.session.get(Customer, from_number):
+            db.session.add(Customer(phone_number=from_number))
         db.session.add(call_log)
         db.session.commit()
     
-    base_url = get_base_url()
-    
     # Generate Plivo XML
-    xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Speak>Welcome to our IVR system.</Speak>
-    <GetDigits action="{base_url}/ivr/language" method="POST" numDigits="1" timeout="10" retries="2">
-        <Speak>Press 1 for English. Press 2 for Spanish.</Speak>
-    </GetDigits>
-    <Speak>We did not receive your input. Goodbye.</Speak>
-    <Hangup/>
-</Response>'''
-    
-    return xml_response, 200, {'Content-Type': 'text/xml'}
+    return _IVR_START_XML, 200, _XML_HEADERS
 
 
 @app.route('/ivr/language', methods=['POST'])
@@ -162,37 +319,25 @@ def ivr_language():
     call_uuid = request.values.get('CallUUID')
     digit = request.values.get('Digits')
     
-    base_url = get_base_url()
-    
     # Map digit to language
     language_map = {'1': 'english', '2': 'spanish'}
     language = language_map.get(digit)
     
     if not language:
         # Invalid input
-        xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Speak>Invalid selection.</Speak>
-    <Redirect>{base_url}/ivr/start</Redirect>
-</Response>'''
-        return xml_response, 200, {'Content-Type': 'text/xml'}
+        return _INVALID_START_XML, 200, _XML_HEADERS
     
     # Update call session
     update_call_language(call_uuid, language)
     
     # Update call log
-    call_log = CallLog.query.filter_by(call_uuid=call_uuid).first()
+    call_log = db.session.scalar(select(CallLog).where(CallLog.call_uuid == call_uuid))
     if call_log:
         call_log.language_selected = language
         db.session.commit()
     
     # Redirect to menu
-    xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Redirect>{base_url}/ivr/menu</Redirect>
-</Response>'''
-    
-    return xml_response, 200, {'Content-Type': 'text/xml'}
+    return _REDIRECT_MENU_XML, 200, _XML_HEADERS
 
 
 @app.route('/ivr/menu', methods=['GET', 'POST'])
@@ -203,32 +348,10 @@ def ivr_menu():
     
     if not session or not session['language']:
         # Fallback to start
-        base_url = get_base_url()
-        xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Redirect>{base_url}/ivr/start</Redirect>
-</Response>'''
-        return xml_response, 200, {'Content-Type': 'text/xml'}
-    
-    language = session['language']
-    base_url = get_base_url()
-    
-    # Language-specific prompts
-    if language == 'english':
-        prompt = "Press 1 to play a message. Press 2 to connect to a live agent."
-    else:
-        prompt = "Presione 1 para reproducir un mensaje. Presione 2 para conectarse con un agente en vivo."
-    
-    xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <GetDigits action="{base_url}/ivr/action" method="POST" numDigits="1" timeout="10" retries="2">
-        <Speak>{prompt}</Speak>
-    </GetDigits>
-    <Speak>No input received. Goodbye.</Speak>
-    <Hangup/>
-</Response>'''
+        return _REDIRECT_START_XML, 200, _XML_HEADERS
     
-    return xml_response, 200, {'Content-Type': 'text/xml'}
+    # Language-specific menu
+    return _localized(_MENU_XML, session['language']), 200, _XML_HEADERS
 
 
 @app.route('/ivr/action', methods=['POST'])
@@ -239,30 +362,13 @@ def ivr_action():
     session = get_call_session(call_uuid)
     
     if not session:
-        xml_response = '''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Speak>Session error. Goodbye.</Speak>
-    <Hangup/>
-</Response>'''
-        return xml_response, 200, {'Content-Type': 'text/xml'}
+        return _SESSION_ERROR_XML, 200, _XML_HEADERS
     
     language = session['language']
-    base_url = get_base_url()
     
     if digit == '1':
         # Play audio message
-        if language == 'english':
-            message = "Thank you for calling. This is a demo message. You will now be disconnected."
-        else:
-            message = "Gracias por llamar. Este es un mensaje de demostración. Ahora se desconectará."
-        
-        xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Speak>{message}</Speak>
-    <Hangup/>
-</Response>'''
-        
-        return xml_response, 200, {'Content-Type': 'text/xml'}
+        return _localized(_DEMO_XML, language), 200, _XML_HEADERS
     
     elif digit == '2':
         # Connect to agent
@@ -270,58 +376,28 @@ def ivr_action():
         
         if not agent_id:
             # No agent available
-            if language == 'english':
-                message = "Sorry, all agents are currently busy. Please try again later."
-            else:
-                message = "Lo sentimos, todos los agentes están ocupados. Por favor, inténtelo más tarde."
-            
-            xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Speak>{message}</Speak>
-    <Hangup/>
-</Response>'''
-            
-            return xml_response, 200, {'Content-Type': 'text/xml'}
+            return _localized(_NO_AGENT_XML, language), 200, _XML_HEADERS
         
         # Mark agent as busy
         agent_heap_manager.mark_agent_busy(agent_id, call_uuid)
         update_call_agent(call_uuid, agent_id)
         
         # Update call log
-        call_log = CallLog.query.filter_by(call_uuid=call_uuid).first()
+        call_log = db.session.scalar(select(CallLog).where(CallLog.call_uuid == call_uuid))
         if call_log:
             call_log.agent_id = agent_id
             db.session.commit()
         
         # Emit real-time update
-        socketio.emit('agent_status_update', agent_heap_manager.get_agent_stats())
+        agent_heap_manager.notify()
         
         # For demo: Simulate agent connection with hold music, then feedback
         # In production, replace with real Dial to agent_phone
-        if language == 'english':
-            agent_msg = "You have been connected to an agent. Thank you for calling."
-        else:
-            agent_msg = "Ha sido conectado con un agente. Gracias por llamar."
-        
-        xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Speak>Connecting you to an agent. Please hold.</Speak>
-    <Wait length="2"/>
-    <Speak>{agent_msg}</Speak>
-    <Redirect>{base_url}/ivr/feedback</Redirect>
-</Response>'''
-        
-        return xml_response, 200, {'Content-Type': 'text/xml'}
+        return _localized(_AGENT_CONNECTED_XML, language), 200, _XML_HEADERS
     
     else:
         # Invalid input
-        xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Speak>Invalid selection.</Speak>
-    <Redirect>{base_url}/ivr/menu</Redirect>
-</Response>'''
-        
-        return xml_response, 200, {'Content-Type': 'text/xml'}
+        return _INVALID_MENU_XML, 200, _XML_HEADERS
 
 
 @app.route('/ivr/feedback', methods=['GET', 'POST'])
@@ -338,43 +414,16 @@ def ivr_feedback():
     if session:
         language = session.get('language', 'english')
     
-    base_url = get_base_url()
-    
     # If agent call failed (only for real Dial operations)
     if dial_status != 'completed' and session and session.get('agent_id'):
         # Release agent since call failed
         agent_heap_manager.release_agent(session['agent_id'], 0)
-        socketio.emit('agent_status_update', agent_heap_manager.get_agent_stats())
-        
-        if language == 'english':
-            prompt = "The agent connection failed. Thank you for calling. Goodbye."
-        else:
-            prompt = "La conexión del agente falló. Gracias por llamar. Adiós."
+        agent_heap_manager.notify()
         
-        xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Speak>{prompt}</Speak>
-    <Hangup/>
-</Response>'''
-        
-        return xml_response, 200, {'Content-Type': 'text/xml'}
+        return _localized(_AGENT_FAILED_XML, language), 200, _XML_HEADERS
     
     # Agent call was successful - collect feedback
-    if language == 'english':
-        prompt = "Please rate your experience. Press 1 for Poor, 2 for Fair, 3 for Good, or 4 for Excellent."
-    else:
-        prompt = "Por favor califique su experiencia. Presione 1 para Pobre, 2 para Regular, 3 para Bueno o 4 para Excelente."
-    
-    xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <GetDigits action="{base_url}/plivo/callback" method="POST" numDigits="1" timeout="10" retries="1">
-        <Speak>{prompt}</Speak>
-    </GetDigits>
-    <Speak>Thank you. Goodbye.</Speak>
-    <Hangup/>
-</Response>'''
-    
-    return xml_response, 200, {'Content-Type': 'text/xml'}
+    return _localized(_FEEDBACK_XML, language), 200, _XML_HEADERS
 
 
 @app.route('/plivo/callback', methods=['POST'])
@@ -385,27 +434,45 @@ def plivo_callback():
     
     session, duration = end_call_session(call_uuid)
     
+    # Persist off the request path so Plivo gets its XML right away
     if session:
+        socketio.start_background_task(
+            persist_call_completion,
+            call_uuid, feedback_digit, session, duration, datetime.utcnow()
+        )
+    
+    return _GOODBYE_XML, 200, _XML_HEADERS
+
+
+def persist_call_completion(call_uuid, feedback_digit, session, duration, end_time):
+    """Record call completion and feedback, then release the agent (background task)"""
+    with app.app_context():
         customer_phone = session['customer_phone']
         agent_id = session['agent_id']
         
+        # Load call log, customer and agent phone in a single round-trip
+        row = db.session.execute(
+            select(CallLog, Customer, Agent.phone_number)
+            .outerjoin(Customer, CallLog.customer_phone == Customer.phone_number)
+            .outerjoin(Agent, CallLog.agent_id == Agent.id)
+            .where(CallLog.call_uuid == call_uuid)
+        ).one_or_none()
+        call_log, customer, agent_phone = row if row else (None, None, None)
+        
         # Update call log
-        call_log = CallLog.query.filter_by(call_uuid=call_uuid).first()
         if call_log:
-            call_log.end_time = datetime.utcnow()
+            call_log.end_time = end_time
             call_log.duration = duration
             call_log.status = 'completed'
-            db.session.commit()
         
         # Update customer
-        customer = Customer.query.get(customer_phone)
         if customer:
             customer.update_metrics(duration)
             if agent_id:
-                customer.last_agent_connected = Agent.query.get(agent_id).phone_number
-            db.session.commit()
+                customer.last_agent_connected = agent_phone
         
         # Process feedback
+        agent_rating = None
         if feedback_digit and feedback_digit in ['1', '2', '3', '4']:
             rating = int(feedback_digit)
             
@@ -424,25 +491,18 @@ def plivo_callback():
                 if customer:
                     customer.last_feedback_rating = rating
                 
-                db.session.commit()
-                
-                # Update agent feedback score
-                agent_heap_manager.update_agent_feedback(agent_id, rating)
+                # Agent feedback score is applied on release
+                agent_rating = rating
+        
+        # Call log, customer and feedback in one commit
+        db.session.commit()
         
         # Release agent
         if agent_id:
-            agent_heap_manager.release_agent(agent_id, duration)
+            agent_heap_manager.release_agent(agent_id, duration, agent_rating)
             
             # Emit real-time update
-            socketio.emit('agent_status_update', agent_heap_manager.get_agent_stats())
-    
-    xml_response = '''<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Speak>Thank you for your feedback. Goodbye.</Speak>
-    <Hangup/>
-</Response>'''
-    
-    return xml_response, 200, {'Content-Type': 'text/xml'}
+            agent_heap_manager.notify()
 
 
 # ==================== API ENDPOINTS ====================
@@ -454,20 +514,27 @@ def get_agent_stats():
     return jsonify(stats)
 
 
+@app.route('/api/agent-recent-calls', methods=['GET'])
+def get_agent_recent_calls():
+    """Get each agent's calls from the last hour"""
+    return jsonify(agent_heap_manager.get_recent_calls())
+
+
 @app.route('/api/reset-agents', methods=['POST'])
 def reset_agents():
     """Reset all agents to available state (for testing)"""
     try:
-        agents = Agent.query.all()
+        agents = db.session.scalars(select(Agent)).all()
         for agent in agents:
             agent.is_available = True
+            agent.refresh_priority_score()
         db.session.commit()
         
         # Reinitialize heaps
         agent_heap_manager.initialize_heaps()
         
         # Emit update
-        socketio.emit('agent_status_update', agent_heap_manager.get_agent_stats())
+        agent_heap_manager.notify()
         
         return jsonify({'success': True, 'message': 'All agents reset to available'})
     except Exception as e:
@@ -477,19 +544,30 @@ def reset_agents():
 @app.route('/api/call-history', methods=['GET'])
 def get_call_history():
     """Get recent call history"""
-    calls = CallLog.query.order_by(CallLog.start_time.desc()).limit(50).all()
-    
-    history = []
-    for call in calls:
-        history.append({
-            'call_uuid': call.call_uuid,
-            'customer': call.customer_phone,
-            'agent_id': call.agent_id,
-            'language': call.language_selected,
-            'duration': call.duration,
-            'status': call.status,
-            'start_time': call.start_time.isoformat() if call.start_time else None
-        })
+    # Only the serialized columns, as plain tuples
+    rows = db.session.execute(
+        select(
+            CallLog.call_uuid, CallLog.customer_phone, CallLog.agent_id,
+            CallLog.language_selected, CallLog.duration, CallLog.status,
+            CallLog.start_time
+        )
+        .order_by(CallLog.start_time.desc())
+        .limit(50)
+    ).all()
+    
+    history = [
+        {
+            'call_uuid': call_uuid,
+            'customer': customer_phone,
+            'agent_id': agent_id,
+            'language': language_selected,
+            'duration': duration,
+            'status': status,
+            'start_time': start_time.isoformat() if start_time else None
+        }
+        for (call_uuid, customer_phone, agent_id, language_selected,
+             duration, status, start_time) in rows
+    ]
     
     return jsonify(history)
 
@@ -519,4 +597,5 @@ if __name__ == '__main__':
     print(f"👥 English Agent: {app.config['ENGLISH_AGENT_NUMBER']}")
     print(f"👥 Spanish Agent: {app.config['SPANISH_AGENT_NUMBER']}")
     
-    socketio.run(app, debug=True, port=5000, allow_unsafe_werkzeug=True)
+    # Development server (eventlet); use wsgi.py with gunicorn in production
+    socketio.run(app, debug=True, port=5000)
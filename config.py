@@ -10,12 +10,25 @@ class Config:
     # Database
     SQLALCHEMY_DATABASE_URI = 'sqlite:///ivr_system.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 20,
+        'max_overflow': 10,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,  # in seconds
+        'connect_args': {'check_same_thread': False}  # SQLite only
+    }
+    
+    # Redis (shared call sessions and SocketIO message queue across workers)
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
     
     # Plivo
     PLIVO_AUTH_ID = os.environ.get('PLIVO_AUTH_ID')
     PLIVO_AUTH_TOKEN = os.environ.get('PLIVO_AUTH_TOKEN')
     PLIVO_FROM_NUMBER = os.environ.get('PLIVO_FROM_NUMBER', '14692463987')
     
+    # Public base URL for Plivo callbacks (your ngrok URL when testing)
+    BASE_URL = os.environ.get('NGROK_URL', 'https://scholarly-introspective-irene.ngrok-free.dev')
+    
     # Test Numbers
     ENGLISH_AGENT_NUMBER = '14692463990'
     SPANISH_AGENT_NUMBER = '918031274121'
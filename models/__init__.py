@@ -1,8 +1,51 @@
+import sqlite3
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
 
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL journaling on SQLite so dashboard reads don't block IVR writes"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def compute_priority_score(is_available, recent_call_count, avg_call_duration,
+                           total_feedback_score, feedback_count):
+    """
+    Priority score from raw agent fields, so callers holding plain column
+    tuples don't need a loaded Agent. Lower score = higher priority
+    """
+    score = 0
+    
+    # Availability (most important)
+    if not is_available:
+        return float('inf')  # Not available = lowest priority
+    
+    # Recent call count penalty (avoid overloading)
+    score += recent_call_count * 10
+    
+    # Average call duration (prefer faster agents)
+    score += avg_call_duration / 60  # convert to minutes
+    
+    # Feedback score bonus (better feedback = lower score)
+    if feedback_count > 0:
+        avg_rating = total_feedback_score / feedback_count
+        score -= avg_rating * 5  # reward good ratings
+    
+    return score
+
+
 class Agent(db.Model):
     __tablename__ = 'agents'
     
@@ -16,9 +59,10 @@ class Agent(db.Model):
     last_call_time = db.Column(db.DateTime)
     total_feedback_score = db.Column(db.Float, default=0.0)
     feedback_count = db.Column(db.Integer, default=0)
+    priority_score = db.Column(db.Float, nullable=False, default=0.0, server_default='0', index=True)  # cached calculate_priority_score()
     
     # Relationships
-    call_logs = db.relationship('CallLog', backref='agent', lazy=True)
+    call_logs = db.relationship('CallLog', backref='agent', lazy=True, order_by='CallLog.start_time.desc()')  # newest first
     feedbacks = db.relationship('Feedback', backref='agent', lazy=True)
     
     def __repr__(self):
@@ -29,35 +73,17 @@ class Agent(db.Model):
         Calculate priority score for heap-based routing.
         Lower score = higher priority
         """
-        score = 0
-        
-        # Availability (most important)
-        if not self.is_available:
-            return float('inf')  # Not available = lowest priority
-        
-        # Recent call count penalty (avoid overloading)
-        score += self.recent_call_count * 10
-        
-        # Average call duration (prefer faster agents)
-        score += self.avg_call_duration / 60  # convert to minutes
-        
-        # Feedback score bonus (better feedback = lower score)
-        if self.feedback_count > 0:
-            avg_rating = self.total_feedback_score / self.feedback_count
-            score -= avg_rating * 5  # reward good ratings
-        
-        return score
+        return compute_priority_score(
+            self.is_available,
+            self.recent_call_count,
+            self.avg_call_duration,
+            self.total_feedback_score,
+            self.feedback_count
+        )
     
-    def update_metrics(self, call_duration):
-        """Update agent metrics after call completion"""
-        # Update average call duration
-        total_duration = self.avg_call_duration * self.total_calls
-        self.total_calls += 1
-        self.avg_call_duration = (total_duration + call_duration) / self.total_calls
-        
-        # Update recent call count
-        self.recent_call_count += 1
-        self.last_call_time = datetime.utcnow()
+    def refresh_priority_score(self):
+        """Store the current priority score (call after changing any of its inputs)"""
+        self.priority_score = self.calculate_priority_score()
 
 
 class Customer(db.Model):
@@ -99,6 +125,12 @@ class CallLog(db.Model):
     duration = db.Column(db.Float)  # in seconds
     status = db.Column(db.String(20))  # 'completed', 'failed', 'no-answer', etc.
     
+    # call_uuid is already indexed through its unique constraint
+    __table_args__ = (
+        db.Index('ix_call_logs_start_time_desc', start_time.desc()),  # recent call history
+        db.Index('ix_call_logs_customer_phone_start_time', customer_phone, start_time),  # per-customer history
+    )
+    
     def __repr__(self):
         return f'<CallLog {self.call_uuid}>'
 
@@ -1,79 +1,283 @@
-import heapq
+import time
+from dataclasses import dataclass
 from threading import Lock
 from datetime import datetime, timedelta
-from models import Agent, db
+from sortedcontainers import SortedList
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import selectinload
+from models import Agent, CallLog, db, compute_priority_score
+
+# Agent columns mirrored by AgentState, in field order
+AGENT_STATE_COLUMNS = (
+    Agent.id, Agent.phone_number, Agent.language, Agent.is_available,
+    Agent.total_calls, Agent.avg_call_duration, Agent.recent_call_count,
+    Agent.last_call_time, Agent.total_feedback_score, Agent.feedback_count
+)
+
+# Minimum gap between agent_status_update broadcasts (~5 per second)
+STATS_EMIT_INTERVAL = 0.2  # in seconds
+
+
+@dataclass(slots=True)
+class AgentState:
+    """
+    In-memory mirror of an agent's mutable columns.
+    Routing reads and mutates this instead of reloading the Agent row;
+    changes are written back with UPDATEs that only touch the changed
+    columns (counters relative to their stored values).
+    """
+    id: int
+    phone_number: str
+    language: str
+    is_available: bool
+    total_calls: int
+    avg_call_duration: float
+    recent_call_count: int
+    last_call_time: datetime | None
+    total_feedback_score: float
+    feedback_count: int
+    
+    def calculate_priority_score(self):
+        return compute_priority_score(
+            self.is_available,
+            self.recent_call_count,
+            self.avg_call_duration,
+            self.total_feedback_score,
+            self.feedback_count
+        )
+    
+    def update_metrics(self, call_duration):
+        """Record a completed call (incremental mean, no total reconstruction)"""
+        self.avg_call_duration += (call_duration - self.avg_call_duration) / (self.total_calls + 1)
+        self.total_calls += 1
+        
+        self.recent_call_count += 1
+        self.last_call_time = datetime.utcnow()
+
 
 class AgentHeapManager:
     """
     Manages two separate heaps for English and Spanish agents.
     Uses priority scoring for intelligent load balancing.
+    
+    Each heap is a SortedList of (priority, agent_id, phone_number) entries,
+    indexed by agent_id, so an agent is re-prioritized by removing its old
+    entry instead of leaving a stale one behind.
     """
     
     def __init__(self):
-        self.english_heap = []
-        self.spanish_heap = []
+        self.english_heap = SortedList()
+        self.spanish_heap = SortedList()
+        self.heap_entries = {}  # {agent_id: (priority, agent_id, phone_number)}
         self.lock = Lock()
         
+        # Cached agent state (available agents from initialize_heaps, others loaded on release)
+        self.agents = {}  # {agent_id: AgentState}
+        
         # Track agents currently in calls
         self.busy_agents = {}  # {agent_id: call_uuid}
+        
+        # Coalesced dashboard broadcasts (see notify)
+        self.app = None
+        self.socketio = None
+        self._emit_lock = Lock()
+        self._pending_emit = False
+        self._last_emit_ts = 0
+    
+    def init_app(self, app, socketio):
+        """Bind the Flask app and SocketIO server used for stats broadcasts"""
+        self.app = app
+        self.socketio = socketio
+    
+    def notify(self):
+        """
+        Schedule an agent_status_update broadcast.
+        Calls arriving while one is pending are coalesced into it, and
+        broadcasts are spaced at least STATS_EMIT_INTERVAL apart.
+        """
+        with self._emit_lock:
+            if self._pending_emit:
+                return
+            self._pending_emit = True
+        
+        self.socketio.start_background_task(self._emit_stats)
+    
+    def _emit_stats(self):
+        delay = STATS_EMIT_INTERVAL - (time.monotonic() - self._last_emit_ts)
+        if delay > 0:
+            self.socketio.sleep(delay)
+        
+        # Clear before reading, so changes committed during the read schedule another emit
+        with self._emit_lock:
+            self._pending_emit = False
+            self._last_emit_ts = time.monotonic()
+        
+        with self.app.app_context():
+            stats = self.get_agent_stats()
+        self.socketio.emit('agent_status_update', stats)
     
     def initialize_heaps(self):
         """Initialize heaps with all available agents from database"""
         with self.lock:
-            # Clear existing heaps
-            self.english_heap = []
-            self.spanish_heap = []
-            
-            # Get all agents
-            agents = Agent.query.all()
+            # Available agents only, as plain rows (database is the source of truth on startup)
+            rows = db.session.execute(
+                select(*AGENT_STATE_COLUMNS).where(Agent.is_available.is_(True))
+            ).all()
+            self.agents = {row.id: AgentState(*row) for row in rows}
             
-            for agent in agents:
-                if agent.is_available:
-                    priority = agent.calculate_priority_score()
-                    heap_entry = (priority, agent.id, agent.phone_number)
-                    
-                    if agent.language == 'english':
-                        heapq.heappush(self.english_heap, heap_entry)
-                    elif agent.language == 'spanish':
-                        heapq.heappush(self.spanish_heap, heap_entry)
+            self._rebuild_heaps()
+    
+    def _rebuild_heaps(self):
+        """Refill both heaps from the cached agent state (caller holds the lock)"""
+        # Clear existing heaps
+        self.english_heap = SortedList()
+        self.spanish_heap = SortedList()
+        self.heap_entries = {}
+        
+        for state in self.agents.values():
+            if state.is_available:
+                self._push(state)
+    
+    def _heap_for(self, language):
+        if language == 'english':
+            return self.english_heap
+        elif language == 'spanish':
+            return self.spanish_heap
+        return None
+    
+    def _push(self, state):
+        """Insert agent into its language heap at its current priority"""
+        heap = self._heap_for(state.language)
+        if heap is None:
+            return
+        
+        # Drop the agent's previous entry, if any, before re-inserting
+        old_entry = self.heap_entries.pop(state.id, None)
+        if old_entry is not None:
+            heap.discard(old_entry)
+        
+        heap_entry = (state.calculate_priority_score(), state.id, state.phone_number)
+        heap.add(heap_entry)
+        self.heap_entries[state.id] = heap_entry
+    
+    def _get_state(self, agent_id):
+        """
+        Cached state for an agent, loading it if it was busy at startup
+        (e.g. a call session that outlived a restart). Caller holds the lock.
+        """
+        state = self.agents.get(agent_id)
+        if state is None:
+            row = db.session.execute(
+                select(*AGENT_STATE_COLUMNS).where(Agent.id == agent_id)
+            ).one_or_none()
+            if row:
+                state = self.agents[agent_id] = AgentState(*row)
+        return state
     
     def get_best_agent(self, language):
         """
         Get the best available agent for the specified language.
         Returns (agent_id, phone_number) or (None, None) if no agent available.
+        
+        The candidate is popped under the lock; the database claim happens
+        after releasing it, so concurrent picks don't queue behind each
+        other's commits. The claim is atomic, so several workers can route
+        from their own heaps; a worker whose heap runs dry reloads that
+        language's available agents (e.g. ones another worker released)
+        before giving up.
         """
-        with self.lock:
-            heap = self.english_heap if language == 'english' else self.spanish_heap
-            
-            # Find first available agent (not busy)
-            while heap:
-                priority, agent_id, phone_number = heapq.heappop(heap)
+        reloaded = False
+        while True:
+            with self.lock:
+                state = self._pop_candidate(language)
+                if state is None and not reloaded:
+                    self._reload_available(language)
+                    reloaded = True
+                    state = self._pop_candidate(language)
+                if state is None:
+                    return None, None
                 
-                # Check if agent is still available and not busy
-                agent = Agent.query.get(agent_id)
-                if agent and agent.is_available and agent_id not in self.busy_agents:
-                    # Mark as busy
-                    agent.is_available = False
-                    db.session.commit()
-                    
-                    return agent_id, phone_number
+                # Claim in the cache first so concurrent pickers skip this agent
+                state.is_available = False
+            
+            # Atomic claim: only succeeds if no other worker took the agent
+            try:
+                claimed = db.session.execute(
+                    update(Agent)
+                    .where(Agent.id == state.id, Agent.is_available.is_(True))
+                    .values(is_available=False, priority_score=state.calculate_priority_score())
+                    .returning(Agent.id)
+                ).first()
+                db.session.commit()
+            except Exception:
+                # Claim never happened; put the agent back as it was
+                db.session.rollback()
+                with self.lock:
+                    state.is_available = True
+                    self._push(state)
+                raise
+            
+            if claimed is not None:
+                return state.id, state.phone_number
             
-            return None, None
+            # Busy in the database (another worker holds it). Drop the stale
+            # cached state; whichever worker releases the agent makes it
+            # available in the database, where _reload_available finds it
+            with self.lock:
+                self.agents.pop(state.id, None)
+    
+    def _reload_available(self, language):
+        """Refresh cached state for a language's available agents from the database (caller holds the lock)"""
+        rows = db.session.execute(
+            select(*AGENT_STATE_COLUMNS)
+            .where(Agent.language == language, Agent.is_available.is_(True))
+        ).all()
+        
+        for row in rows:
+            if row.id not in self.busy_agents:
+                state = self.agents[row.id] = AgentState(*row)
+                self._push(state)
+    
+    def _pop_candidate(self, language):
+        """Pop the best agent that is still available and not busy (caller holds the lock)"""
+        heap = self.english_heap if language == 'english' else self.spanish_heap
+        
+        # Find first available agent (not busy)
+        while heap:
+            priority, agent_id, phone_number = heap.pop(0)
+            del self.heap_entries[agent_id]
+            
+            # Check if agent is still available and not busy
+            state = self.agents.get(agent_id)
+            if state and state.is_available and agent_id not in self.busy_agents:
+                return state
+        
+        return None
     
     def mark_agent_busy(self, agent_id, call_uuid):
         """Mark an agent as busy with a specific call"""
         with self.lock:
             self.busy_agents[agent_id] = call_uuid
             
-            agent = Agent.query.get(agent_id)
-            if agent:
-                agent.is_available = False
+            # Already claimed in the database if the agent came from get_best_agent
+            state = self.agents.get(agent_id)
+            if state and state.is_available:
+                state.is_available = False
+                # Only the columns this changes; the cached counters may be stale
+                db.session.execute(
+                    update(Agent).where(Agent.id == agent_id).values(
+                        is_available=False,
+                        priority_score=state.calculate_priority_score()
+                    )
+                )
                 db.session.commit()
     
-    def release_agent(self, agent_id, call_duration):
+    def release_agent(self, agent_id, call_duration, rating=None):
         """
         Release agent after call completion and reinsert into heap.
-        Updates agent metrics and recalculates priority.
+        Updates agent metrics (and feedback, if a rating is given) and
+        recalculates priority. The database row is updated relative to its
+        current values in one atomic UPDATE, with no read-modify-write.
         """
         with self.lock:
             # Remove from busy agents
@@ -81,71 +285,134 @@ class AgentHeapManager:
                 del self.busy_agents[agent_id]
             
             # Update agent metrics
-            agent = Agent.query.get(agent_id)
-            if agent:
-                agent.update_metrics(call_duration)
-                agent.is_available = True
+            state = self._get_state(agent_id)
+            if state:
+                state.update_metrics(call_duration)
+                values = {
+                    'avg_call_duration': Agent.avg_call_duration
+                        + (call_duration - Agent.avg_call_duration) / (Agent.total_calls + 1),
+                    'total_calls': Agent.total_calls + 1,
+                    'recent_call_count': Agent.recent_call_count + 1,
+                    'last_call_time': state.last_call_time,
+                    'is_available': True
+                }
+                if rating is not None:
+                    state.total_feedback_score += rating
+                    state.feedback_count += 1
+                    values['total_feedback_score'] = Agent.total_feedback_score + rating
+                    values['feedback_count'] = Agent.feedback_count + 1
+                state.is_available = True
+                values['priority_score'] = state.calculate_priority_score()
+                
+                db.session.execute(update(Agent).where(Agent.id == agent_id).values(**values))
                 db.session.commit()
                 
                 # Reinsert into appropriate heap with new priority
-                priority = agent.calculate_priority_score()
-                heap_entry = (priority, agent.id, agent.phone_number)
-                
-                if agent.language == 'english':
-                    heapq.heappush(self.english_heap, heap_entry)
-                elif agent.language == 'spanish':
-                    heapq.heappush(self.spanish_heap, heap_entry)
-    
-    def update_agent_feedback(self, agent_id, rating):
-        """Update agent feedback score and recalculate priority"""
-        agent = Agent.query.get(agent_id)
-        if agent:
-            agent.total_feedback_score += rating
-            agent.feedback_count += 1
-            db.session.commit()
+                self._push(state)
     
     def reset_recent_call_counts(self):
         """Reset recent call counts (should be run hourly)"""
         with self.lock:
-            agents = Agent.query.all()
-            for agent in agents:
-                agent.recent_call_count = 0
-            db.session.commit()
+            # Cache the agents not loaded yet (busy at startup), so every score is recomputed
+            for row in db.session.execute(
+                select(*AGENT_STATE_COLUMNS).where(Agent.id.not_in(list(self.agents)))
+            ):
+                self.agents[row.id] = AgentState(*row)
+            
+            for state in self.agents.values():
+                state.recent_call_count = 0
             
-            # Rebuild heaps with new priorities
-            self.initialize_heaps()
+            # One executemany UPDATE; Core table, since ORM bulk updates don't take a WHERE
+            if self.agents:
+                db.session.execute(
+                    update(Agent.__table__)
+                    .where(Agent.id == bindparam('agent_id'))
+                    .values(recent_call_count=0, priority_score=bindparam('score')),
+                    [
+                        {'agent_id': state.id, 'score': state.calculate_priority_score()}
+                        for state in self.agents.values()
+                    ]
+                )
+                db.session.commit()
+            
+            # Rebuild heaps with new priorities (from the cache)
+            self._rebuild_heaps()
     
     def get_agent_stats(self):
         """Get current stats for all agents (for dashboard)"""
         english_agents = []
         spanish_agents = []
         
-        agents = Agent.query.all()
-        for agent in agents:
+        # Plain column tuples - no ORM objects needed for a read-only view
+        rows = db.session.execute(
+            select(
+                Agent.id, Agent.phone_number, Agent.language, Agent.is_available,
+                Agent.total_calls, Agent.avg_call_duration, Agent.total_feedback_score,
+                Agent.feedback_count, Agent.priority_score
+            )
+        ).all()
+        
+        for (agent_id, phone_number, language, is_available, total_calls,
+             avg_call_duration, total_feedback_score, feedback_count,
+             priority) in rows:
             avg_rating = 0
-            if agent.feedback_count > 0:
-                avg_rating = round(agent.total_feedback_score / agent.feedback_count, 2)
+            if feedback_count > 0:
+                avg_rating = round(total_feedback_score / feedback_count, 2)
             
             agent_info = {
-                'id': agent.id,
-                'phone': agent.phone_number,
-                'language': agent.language,
-                'available': agent.is_available,
-                'total_calls': agent.total_calls,
-                'avg_duration': round(agent.avg_call_duration, 2),
+                'id': agent_id,
+                'phone': phone_number,
+                'language': language,
+                'available': is_available,
+                'total_calls': total_calls,
+                'avg_duration': round(avg_call_duration, 2),
                 'avg_rating': avg_rating,
-                'priority': round(agent.calculate_priority_score(), 2)
+                'priority': round(priority, 2)
             }
             
-            if agent.language == 'english':
+            if language == 'english':
                 english_agents.append(agent_info)
-            elif agent.language == 'spanish':
+            elif language == 'spanish':
                 spanish_agents.append(agent_info)
         
         return {
             'english': english_agents,
             'spanish': spanish_agents
         }
+    
+    def get_recent_calls(self, window=timedelta(hours=1)):
+        """
+        Get each agent's calls from the last `window` (for dashboard).
+        Call logs are batch-loaded with selectinload, so this is two
+        queries regardless of how many agents there are; the relationship's
+        order_by has the database return them newest first.
+        """
+        since = datetime.utcnow() - window
+        
+        agents = db.session.scalars(
+            select(Agent)
+            .options(selectinload(Agent.call_logs.and_(CallLog.start_time > since)))
+            .order_by(Agent.id)
+        ).all()
+        
+        return [
+            {
+                'id': agent.id,
+                'phone': agent.phone_number,
+                'language': agent.language,
+                'calls': [
+                    {
+                        'call_uuid': call.call_uuid,
+                        'customer': call.customer_phone,
+                        'duration': call.duration,
+                        'status': call.status,
+                        'start_time': call.start_time.isoformat() if call.start_time else None
+                    }
+                    for call in agent.call_logs
+                ]
+            }
+            for agent in agents
+        ]
 
 
 # Global instance
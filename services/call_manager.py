@@ -1,37 +1,94 @@
 from datetime import datetime
+import socket
+import time
+import redis
 
-# Store active call sessions
-# Format: {call_uuid: {'customer_phone': str, 'language': str, 'agent_id': int, 'start_time': datetime}}
-active_calls = {}
+from config import Config
+
+# Store active call sessions in Redis so every worker sees the same state
+# Format: call:{call_uuid} -> hash {'customer_phone': str, 'language': str, 'agent_id': int,
+#         'start_time': ISO datetime, 'start_monotonic': float, 'host': str}
+# Empty strings stand in for None (Redis hashes only hold strings)
+# start_time is for display; durations use start_monotonic, which is only
+# comparable on the host that recorded it
+redis_client = redis.Redis.from_url(Config.REDIS_URL, decode_responses=True)
+
+_HOST = socket.gethostname()
+
+# Abandoned sessions (calls that never reach the callback) expire on their own;
+# the expiry restarts on every session update, so active calls keep their session
+CALL_SESSION_TTL = 3600  # in seconds
+
+# Only update fields of a session that still exists, and refresh its expiry
+_SET_IF_EXISTS = redis_client.register_script('''
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    return redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return 0
+''')
+
+# Read and remove a session atomically, so only one worker can end a call
+_POP_SESSION = redis_client.register_script('''
+local session = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return session
+''')
+
+
+def _session_key(call_uuid):
+    return f'call:{call_uuid}'
+
+def _decode_session(data):
+    """Convert a stored hash back into the session dict"""
+    return {
+        'customer_phone': data['customer_phone'],
+        'language': data['language'] or None,
+        'agent_id': int(data['agent_id']) if data['agent_id'] else None,
+        'start_time': datetime.fromisoformat(data['start_time']),
+        'start_monotonic': float(data['start_monotonic']),
+        'host': data['host']
+    }
+
+def _session_duration(session):
+    """Seconds since the session started (monotonic when measured on the same host)"""
+    if session['host'] == _HOST:
+        return time.monotonic() - session['start_monotonic']
+    return (datetime.utcnow() - session['start_time']).total_seconds()
 
 def create_call_session(call_uuid, customer_phone):
     """Create a new call session"""
-    active_calls[call_uuid] = {
-        'customer_phone': customer_phone,
-        'language': None,
-        'agent_id': None,
-        'start_time': datetime.utcnow()
-    }
+    key = _session_key(call_uuid)
+    pipe = redis_client.pipeline()
+    pipe.hset(key, mapping={
+        'customer_phone': customer_phone or '',
+        'language': '',
+        'agent_id': '',
+        'start_time': datetime.utcnow().isoformat(),
+        'start_monotonic': repr(time.monotonic()),
+        'host': _HOST
+    })
+    pipe.expire(key, CALL_SESSION_TTL)
+    pipe.execute()
 
 def update_call_language(call_uuid, language):
     """Update the language selected in IVR"""
-    if call_uuid in active_calls:
-        active_calls[call_uuid]['language'] = language
+    _SET_IF_EXISTS(keys=[_session_key(call_uuid)], args=['language', language, CALL_SESSION_TTL])
 
 def update_call_agent(call_uuid, agent_id):
     """Update the agent assigned to the call"""
-    if call_uuid in active_calls:
-        active_calls[call_uuid]['agent_id'] = agent_id
+    _SET_IF_EXISTS(keys=[_session_key(call_uuid)], args=['agent_id', agent_id, CALL_SESSION_TTL])
 
 def get_call_session(call_uuid):
     """Get call session data"""
-    return active_calls.get(call_uuid)
+    data = redis_client.hgetall(_session_key(call_uuid))
+    return _decode_session(data) if data else None
 
 def end_call_session(call_uuid):
     """End and remove call session"""
-    if call_uuid in active_calls:
-        session = active_calls[call_uuid]
-        duration = (datetime.utcnow() - session['start_time']).total_seconds()
-        del active_calls[call_uuid]
+    fields = _POP_SESSION(keys=[_session_key(call_uuid)])
+    if fields:
+        session = _decode_session(dict(zip(fields[::2], fields[1::2])))
+        duration = _session_duration(session)
         return session, duration
     return None, 0
@@ -96,7 +96,7 @@ function renderAgents(agents, container) {
                 <strong>Avg Rating:</strong> ${agent.avg_rating > 0 ? agent.avg_rating + '/4' : 'N/A'}
             </div>
             <div class="agent-info">
-                <strong>Priority Score:</strong> ${agent.priority}
+                <strong>Priority Score:</strong> ${agent.priority !== null ? agent.priority : 'N/A'}
             </div>
         </div>
     `).join('');
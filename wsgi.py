@@ -0,0 +1,11 @@
+"""
+Production entry point:
+    gunicorn -k eventlet -w 1 --bind 0.0.0.0:5000 wsgi:app
+
+Each worker keeps its own agent heaps in memory. Agents are claimed
+atomically in the database, and a worker whose heap runs dry reloads the
+available agents from it, so more workers (-w) can share one database.
+"""
+from app import app, init_db
+
+init_db()